@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: compiled FIELD_SPEC extractor vs the old hand-written
+parse_detail body. Checks both build identical records, then times them.
+
+    python bench_parse.py [iterations]
+"""
+import re, sys, random, timeit
+
+import scraper
+from scraper import ALL_FIELDS, EXTRA, record_hash, parse_detail
+
+def legacy_parse_detail(js, url, cid):
+    # parse_detail as it was before FIELD_SPEC (pval closure, dict.fromkeys, re.search)
+    inner = js.get("pageProps", {}).get("pageProps", {})
+    prod = inner.get("product")
+    pd = prod.get("product_data") if prod else None
+    if not prod or not pd:
+        return None, None
+
+    imgs = prod.get("afbeeldingen", [])
+    if imgs:
+        m = re.search(r'/products/([0-9]+)/', imgs[0])
+        if not m or m.group(1) != cid:
+            return None, (cid, m.group(1) if m else "NONE", imgs[0])
+
+    def pval(pdata, key):
+        fld = pdata.get(key, {})
+        return fld.get("value") or fld.get("name")
+
+    rec = dict.fromkeys(ALL_FIELDS)
+    rec.update(
+        {
+            "url": url,
+            "title": f"{pval(pd,'merk')} {pval(pd,'model')}".strip(),
+            "subtitle": pval(pd, "type"),
+            "financial_lease_price": prod.get("from_price_business") or prod.get("from_price"),
+            "financial_lease_term": "o.b.v. 72 mnd looptijd",
+            "advertentienummer": cid,
+            "merk": pval(pd, "merk"),
+            "model": pval(pd, "model"),
+            "bouwjaar": pval(pd, "bouwjaar"),
+            "km_stand": pval(pd, "km_stand"),
+            "transmissie": pval(pd, "transmissie"),
+            "prijs": pval(pd, "prijs"),
+            "brandstof": pval(pd, "brandstof"),
+            "btw_marge": pval(pd, "btw_marge"),
+            "opties_accessoires": ", ".join(prod.get("accessoires", [])) or None,
+            "address": prod.get("dealer", {}).get("Plaats_dealer"),
+            **{k: pval(pd, k) for k in EXTRA},
+            "images": imgs,
+        }
+    )
+    rec["content_hash"] = record_hash(rec)
+    return (rec if imgs else None), None
+
+def sample(cid, rnd):
+    # a detail payload shaped like the site's; some fields missing or name-only
+    keys = ["merk", "model", "type", "bouwjaar", "km_stand", "transmissie", "prijs",
+            "brandstof", "btw_marge"] + EXTRA
+    pd = {}
+    for k in keys:
+        r = rnd.random()
+        if r < 0.15:
+            continue
+        pd[k] = {"name": f"{k}-{cid}"} if r < 0.3 else {"value": rnd.randint(1, 99_999), "label": k}
+    prod = {
+        "product_data": pd,
+        "afbeeldingen": [f"https://img.example/products/{cid}/{i}.jpg" for i in range(rnd.randint(1, 30))],
+        "from_price": rnd.randint(100, 2_000),
+        "accessoires": [f"optie {i}" for i in range(rnd.randint(0, 40))],
+        "dealer": {"Plaats_dealer": "Utrecht", "Naam": "Dealer BV"},
+        "omschrijving": "x" * 2_000,
+    }
+    if rnd.random() < 0.5:
+        prod["from_price_business"] = rnd.randint(100, 2_000)
+    return {"pageProps": {"pageProps": {"product": prod}}}
+
+def main(n=20_000):
+    rnd = random.Random(1)
+    cases = [(sample(str(c), rnd), f"{scraper.BASE_URL}/voorraad/{c}", str(c)) for c in range(1_000, 1_200)]
+    for js, url, cid in cases:
+        assert parse_detail(js, url, cid) == legacy_parse_detail(js, url, cid), cid
+    print(f"{len(cases)} payloads: identical records (incl. content_hash)")
+
+    def run(fn, hashing=True):
+        h = scraper.record_hash
+        if not hashing:
+            scraper.record_hash = globals()["record_hash"] = lambda rec: None
+        try:
+            t = min(timeit.repeat(lambda: [fn(*c) for c in cases], number=max(1, n // len(cases)), repeat=3))
+        finally:
+            scraper.record_hash = globals()["record_hash"] = h
+        return t / (max(1, n // len(cases)) * len(cases)) * 1e6
+
+    for label, hashing in (("extract + hash", True), ("extract only", False)):
+        old, new = run(legacy_parse_detail, hashing), run(parse_detail, hashing)
+        print(f"{label:15} legacy {old:6.1f} µs   compiled {new:6.1f} µs   ×{old / new:.2f}")
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
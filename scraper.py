@@ -8,19 +8,44 @@ NeoLease scraper – FULL DEBUG EDITION
 * Everything else identical to your production script
 """
 
-import os, re, csv, io, json, time, math, gc, logging, random, threading
+import os, re, csv, io, json, time, logging, random, threading, hashlib, queue, itertools
+import asyncio, ssl, zlib, sqlite3, argparse, shutil, gzip, glob, multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import namedtuple, deque
+from email.utils import parsedate_to_datetime
 from urllib.parse import urljoin, urlparse, parse_qs, urlencode
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import requests, psycopg2, psycopg2.extras
-from lxml import html
+from requests.adapters import HTTPAdapter
+from lxml import html, etree
 
 # ───────── CONFIG ─────────
-BASE_URL   = "https://www.dtc-lease.nl"
+BASE_URL   = os.environ.get("NEOLEASE_BASE_URL", "https://www.dtc-lease.nl")   # or --base-url
 HEADERS    = {"User-Agent": "Mozilla/5.0", "Accept": "*/*"}
-WORKERS    = 8               # lower to be gentle on Render
-PARSE_CHUNK = 2_000
+WORKERS    = 8               # starting in-flight limit; lower to be gentle on Render
+MAX_WORKERS = 48             # ceiling for the adaptive (AIMD) limit = pool sizes
+LATENCY_SLO = 4.0            # latency EWMA (s) above which the limit is cut
+RATE       = None            # global requests/s ceiling across all sessions (None = off)
+BURST      = 20              # tokens the limiter may bank while idle
+STALE_404S = 5               # _next/data 404s within STALE_WINDOW that trigger a buildId check
+STALE_WINDOW = 30.0
+STALE_RETRIES = 2            # attempts for that homepage re-check (kept short)
+DETAIL_CACHE = "detail_cache.sqlite"   # ETag/Last-Modified cache for detail JSON (None = off)
+CHECKPOINT_DIR = ".neolease_run"       # progress of the current run, for --resume
+SPOOL_DIR  = "spool"         # write-ahead log of scraped records (None = off)
+SPOOL_SEGMENT = 2_000        # records per spool segment file
+ENGINE     = "threads"       # "threads" (requests + pools) or "async" (asyncio, stdlib HTTP)
+ASYNC_CONCURRENCY = 200      # in-flight ceiling for the async engine
+PARSE_PROCS = 0              # >0: decode + parse bodies in that many worker processes
+PARSE_CHUNK = 2_000          # records per DB flush
+FLUSH_SECS  = 60             # … or flush after this many seconds, whichever first
+WRITE_QUEUE = PARSE_CHUNK    # bound on scraped records waiting for the writer
 IMAGE_CHUNK = 10_000
+RETRIES     = 4              # attempts per URL
+BACKOFF     = 1.0            # exponential backoff base (s), full jitter
+BACKOFF_CAP = 30.0
+RETRY_AFTER_CAP = 120.0      # never sleep longer than this on a server hint
 DB_DSN = (
     "dbname=neolease_db_kpz9 "
     "user=neolease_db_kpz9_user "
@@ -44,22 +69,59 @@ EXTRA = [
     "gewicht","topsnelheid","energielabel","gemiddeld_verbruik","tankinhoud"
 ]
 ALL_FIELDS = CORE + EXTRA + ["images"]
+
+# where each column comes from in the detail JSON; compiled once by compile_spec()
+#   ("pd", key)         product_data[key].value, else .name
+#   ("words", k1, k2)   "<pd k1> <pd k2>".strip()
+#   ("prod", k1, k2…)   first truthy product[k]
+#   ("dealer", key)     product.dealer[key]
+#   ("join", key)       ", ".join(product[key]) or None
+#   ("const", v)  ("url",)  ("cid",)  ("images",)
+FIELD_SPEC = {
+    "url": ("url",),
+    "title": ("words", "merk", "model"),
+    "subtitle": ("pd", "type"),
+    "financial_lease_price": ("prod", "from_price_business", "from_price"),
+    "financial_lease_term": ("const", "o.b.v. 72 mnd looptijd"),
+    "advertentienummer": ("cid",),
+    "merk": ("pd", "merk"),
+    "model": ("pd", "model"),
+    "bouwjaar": ("pd", "bouwjaar"),
+    "km_stand": ("pd", "km_stand"),
+    "transmissie": ("pd", "transmissie"),
+    "prijs": ("pd", "prijs"),
+    "brandstof": ("pd", "brandstof"),
+    "btw_marge": ("pd", "btw_marge"),
+    "opties_accessoires": ("join", "accessoires"),
+    "address": ("dealer", "Plaats_dealer"),
+    **{k: ("pd", k) for k in EXTRA},          # EXTRA columns are plain product_data fields
+    "images": ("images",),
+}
+LISTING_COLS = [f for f in ALL_FIELDS if f != "images"] + ["content_hash"]
 INS_LISTINGS = (
-    f"INSERT INTO car_listings ({', '.join(f for f in ALL_FIELDS if f!='images')}) "
-    f"VALUES %s RETURNING id"
+    f"INSERT INTO car_listings ({', '.join(LISTING_COLS)}) "
+    f"VALUES %s RETURNING advertentienummer, id"
 )
+INSERT_PAGE = 500            # rows per multi-row INSERT statement
+LOADER = "copy"              # "copy" (COPY → staging table) or "values" (multi-row INSERT)
+STAGE_LISTINGS = "car_listings_stage"
+STAGE_IMAGES = "car_images_stage"
+IMAGE_COLS = ("image_url", "car_listing_id")
+MODE = "reload"              # "reload" (TRUNCATE + insert) or "incremental" (diff on advertentienummer)
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)-7s %(message)s", datefmt="%H:%M:%S"
 )
 
-# CSV that logs every mismatch we detect
+# CSV that logs every mismatch we detect (written by MismatchLog, see below)
 MISMATCH_CSV = "debug_mismatch.csv"
-with open(MISMATCH_CSV, "w", newline="") as fh:
-    csv.writer(fh).writerow(["listing_id","img_car_id","image_url"])
+MISMATCH_FLUSH = 5.0         # seconds between buffered CSV/DB flushes
+MISMATCH_TABLE = None        # e.g. "debug_mismatch" to mirror rows into Postgres
 
 # ───── tiny helpers ─────
+_STOP = object()             # end-of-stream sentinel for the pipeline queues
+
 def clip(v, col, lims=dict(title=120, subtitle=120, url=200, address=240)):
     if v is None:
         return None
@@ -71,192 +133,1598 @@ def clip(v, col, lims=dict(title=120, subtitle=120, url=200, address=240)):
     lim = lims.get(col, 120)
     return v[:lim] if len(v) > lim else v
 
-def http(url, sess):
-    for _ in range(3):
+HASH_FIELDS = [f for f in ALL_FIELDS if f != "images"]
+
+def record_hash(rec):
+    # stable digest of the clipped columns + image list → skip unchanged cars
+    vals = [clip(rec[f], f) for f in HASH_FIELDS] + [rec["images"]]
+    raw = json.dumps(vals, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+# ───── adaptive concurrency (AIMD) ─────
+class Aimd:
+    """In-flight request limit driven by what comes back from the site:
+    slow start (+1 per healthy response) until the first cut, then +1 per
+    `limit` healthy responses; ×0.5 on 429/5xx/network errors or when the
+    latency EWMA exceeds LATENCY_SLO, at most once per cooldown. 404s count
+    as healthy – the server answered."""
+
+    def __init__(self, start=WORKERS, lo=1, hi=MAX_WORKERS):
+        self.limit, self.lo, self.hi = float(start), lo, hi
+        self.inflight = self.ok = self.cuts = 0
+        self.ewma = None
+        self.slow_start = True
+        self.cut_at = 0.0
+        self.cond = threading.Condition()
+
+    def try_acquire(self):
+        with self.cond:
+            if self.inflight >= int(self.limit):
+                return False
+            self.inflight += 1
+            return True
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, latency, outcome):
+        with self.cond:
+            self.inflight -= 1
+            self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+            now = time.monotonic()
+            if outcome in ("throttled", "failed") or self.ewma > LATENCY_SLO:
+                if now - self.cut_at > max(1.0, self.ewma):
+                    self.limit = max(self.lo, self.limit / 2)
+                    self.cut_at, self.slow_start, self.ok = now, False, 0
+                    self.cuts += 1
+                    logging.debug("AIMD cut → %d (%s, ewma %.2fs)", self.limit, outcome, self.ewma)
+            else:
+                self.ok += 1
+                if self.slow_start or self.ok >= int(self.limit):
+                    self.limit, self.ok = min(self.hi, self.limit + 1), 0
+            self.cond.notify_all()
+
+    def __str__(self):
+        return f"limit {int(self.limit)}  ewma {self.ewma or 0:.2f}s  cuts {self.cuts}"
+
+CONTROL = Aimd()                 # shared by harvest and detail pools
+
+# ───── global rate limit (token bucket) ─────
+class TokenBucket:
+    """Smooth requests/s ceiling shared by every session and engine.
+    reserve() books a token under a lock and returns how long the caller has
+    to wait for it, so threads time.sleep() and coroutines asyncio.sleep()
+    on the same bucket without ever blocking the event loop."""
+
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.stamp = float(burst), time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait(self):
+        if delay := self.reserve():
+            time.sleep(delay)
+
+    async def wait_async(self):
+        if delay := self.reserve():
+            await asyncio.sleep(delay)
+
+LIMITER = TokenBucket(RATE, BURST)
+
+# ───── one pooled session for every phase ─────
+_session, _session_lock = None, threading.Lock()
+
+def make_session(pool=MAX_WORKERS * 2):
+    """Session whose adapters keep up to `pool` TLS connections per host alive;
+    retries are ours (http_fetch), not urllib3's."""
+    sess = requests.Session()
+    sess.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool, max_retries=0)
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+def session():
+    # process-wide shared session: harvest, buildId and detail fetches reuse its pool
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+def pool_stats(sess=None):
+    """(requests, new connections) over the session's live urllib3 pools;
+    requests - connections are the keep-alive hits."""
+    reqs = conns = 0
+    for adapter in {id(a): a for a in (sess or session()).adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            p = pools[key]
+            reqs, conns = reqs + p.num_requests, conns + p.num_connections
+    return reqs, conns
+
+# ───── HTTP with retry policy ─────
+# outcome: "ok" | "gone" (permanent 4xx, never retried) | "throttled" (429 until
+# retries ran out) | "failed" (5xx / network errors until retries ran out)
+Fetch = namedtuple("Fetch", "resp outcome status attempts")
+TRANSIENT = {408, 425, 429, 500, 502, 503, 504}
+
+def classify(status):
+    if status in (200, 304):         # 304 only ever answers our own validators
+        return "ok"
+    if 300 <= status < 400:          # a redirect nobody followed (off-site / too many hops)
+        return "gone"
+    if 400 <= status < 500 and status not in TRANSIENT:
+        return "gone"
+    return "throttled" if status == 429 else "failed"
+
+def retry_after(headers):
+    v = headers.get("retry-after") if headers else None      # both header types are lower-case safe
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        try:
+            return parsedate_to_datetime(v).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+def retry_delay(attempt, headers=None):
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF * 2 ** attempt))
+    hint = retry_after(headers)
+    if hint is not None:
+        delay = max(delay, min(hint, RETRY_AFTER_CAP))
+    return delay
+
+def http_fetch(url, sess, ctl=None, headers=None, retries=RETRIES):
+    """GET under the retry policy; always returns a Fetch describing the outcome.
+    Each attempt holds a slot of the AIMD controller and reports back to it."""
+    ctl = ctl or CONTROL
+    extra, status = headers, None
+    for attempt in range(retries):
+        headers, outcome = None, "failed"
+        LIMITER.wait()                   # pace first, so no AIMD slot idles on the bucket
+        ctl.acquire()
+        t0 = time.monotonic()
         try:
-            r = sess.get(url, headers=HEADERS, timeout=15)
-            if r.status_code == 200:
-                return r
+            r = sess.get(url, headers=extra, timeout=15)
         except requests.RequestException:
             pass
-        time.sleep(4)
-    return None
+        else:
+            status, headers, outcome = r.status_code, r.headers, classify(r.status_code)
+        finally:
+            ctl.release(time.monotonic() - t0, outcome)
+        if RECORDER and outcome in ("ok", "gone"):
+            RECORDER.save(url, r)
+        if outcome == "ok":
+            return Fetch(r, outcome, status, attempt + 1)
+        if outcome == "gone":
+            return Fetch(None, outcome, status, attempt + 1)
+        if attempt + 1 < retries:
+            time.sleep(retry_delay(attempt, headers))
+    return Fetch(None, outcome, status, retries)
+
+def http(url, sess):
+    return http_fetch(url, sess).resp
+
+# parsers take r.content: libxml2 and json.loads decode the bytes themselves, so
+# requests never decodes – or sniffs a charset for – a body we parse
+BUILD_ID = re.compile(rb'"buildId":"([^"]+)"')
+CHARSET = re.compile(r"charset=([\w.:-]+)", re.I)
+_parsers = threading.local()
+
+def charset(r):
+    # the declared charset, else UTF-8 (what the site serves)
+    m = CHARSET.search(r.headers.get("content-type", ""))
+    return m.group(1).lower() if m else "utf-8"
+
+def html_doc(body, enc="utf-8"):
+    """lxml tree straight from response bytes; one parser per thread and charset
+    (lxml parsers must not be shared between threads)."""
+    parsers = _parsers.__dict__
+    if enc not in parsers:
+        try:
+            parsers[enc] = html.HTMLParser(encoding=enc)
+        except LookupError:
+            return html_doc(body)
+    return html.fromstring(body, parser=parsers[enc])
+
+# ───── parse stage: raw bodies → compact results, optionally in other processes ─────
+PARSERS = None                   # ProcessPoolExecutor while PARSE_PROCS > 0
+
+def _parser_init(base_url):
+    global BASE_URL
+    BASE_URL = base_url          # --base-url, for the URLs the parsers build
+
+def start_parsers(procs=PARSE_PROCS):
+    # spawn, not fork: the parent already runs writer/harvest threads
+    global PARSERS
+    if procs > 0:
+        PARSERS = ProcessPoolExecutor(procs, multiprocessing.get_context("spawn"),
+                                      initializer=_parser_init, initargs=(BASE_URL,))
+
+def stop_parsers():
+    global PARSERS
+    if PARSERS:
+        PARSERS.shutdown(cancel_futures=True)
+        PARSERS = None
+
+def parse(fn, *args):
+    """fn(*args) in the parse pool if there is one (the calling I/O thread just
+    waits, holding no GIL), else inline. fn must be a pure module-level parser."""
+    return PARSERS.submit(fn, *args).result() if PARSERS else fn(*args)
+
+async def aparse(fn, *args):
+    if not PARSERS:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(PARSERS, fn, *args)
 
-def get_build_id(sess):
-    m = re.search(r'"buildId":"([^"]+)"', http(BASE_URL, sess).text)
+def get_build_id(sess, retries=RETRIES):
+    f = http_fetch(BASE_URL, sess, retries=retries)
+    m = BUILD_ID.search(f.resp.content) if f.resp else None
     if not m:
-        raise RuntimeError("buildId not found")
-    return m.group(1)
+        raise RuntimeError(f"buildId not found (homepage {f.outcome}, {f.status})")
+    return m.group(1).decode()
+
+class BuildId:
+    """The live Next.js buildId; str() gives the current value, so it drops
+    into the endpoint f-strings. A burst of STALE_404S _next/data 404s within
+    STALE_WINDOW re-fetches it once, outside the lock and with a short retry
+    budget; 404s reported meanwhile are parked rather than blocked. Cars that
+    404'd in the burst before a new id was recognised are handed back through
+    take_retry()."""
+
+    def __init__(self, value):
+        self.value, self.gen = value, 0
+        self.lock = threading.Lock()
+        self.misses = deque()            # (monotonic time, url) of recent 404s
+        self.checking, self.burst = False, []
+        self.retry = []
+
+    def __str__(self):
+        return self.value
+
+    def miss(self, gen, url):
+        """Report a 404 seen under generation `gen`; True → retry with the new id."""
+        with self.lock:
+            if gen != self.gen:
+                return True
+            if self.checking:
+                self.burst.append(url)   # retried via take_retry() if the id changed
+                return False
+            now = time.monotonic()
+            while self.misses and now - self.misses[0][0] > STALE_WINDOW:
+                self.misses.popleft()
+            self.misses.append((now, url))
+            if len(self.misses) < STALE_404S:
+                return False
+            self.burst = [u for _, u in self.misses if u != url]
+            self.misses.clear()
+            self.checking = True
+        try:
+            new = get_build_id(session(), STALE_RETRIES)
+        except RuntimeError as e:
+            new = None
+            logging.warning("buildId re-check failed (%s) – keeping %s", e, self.value)
+        with self.lock:
+            self.checking = False
+            burst, self.burst = self.burst, []
+            if new is None or new == self.value:
+                return False             # genuinely dead listings (or no verdict)
+            logging.warning("buildId changed %s → %s – retrying %d cars", self.value, new, len(burst) + 1)
+            self.value, self.gen = new, self.gen + 1
+            self.retry.extend(burst)
+            return True
+
+    def take_retry(self):
+        with self.lock:
+            out, self.retry = self.retry, []
+        return out
 
 # ───── harvest detail URLs (verbose) ─────
+BRAND_HREFS = etree.XPath('//main//ul/li/a/@href')
+
 def brand_links(sess):
-    page = http(urljoin(BASE_URL, "/merken"), sess)
-    return [
-        urljoin(BASE_URL, u)
-        for u in html.fromstring(page.text).xpath('//main//ul/li/a/@href')
-    ]
+    r = http(urljoin(BASE_URL, "/merken"), sess)
+    return parse_brand_links(r.content, charset(r))
 
-def collect_links():
-    sess = requests.Session()
-    brands = brand_links(sess)
-    step = math.ceil(len(brands) / WORKERS)
-    slices = [brands[i : i + step] for i in range(0, len(brands), step)]
-    urls = set()
-
-    def worker(chunk):
-        s = requests.Session()
-        for b in chunk:
-            page = 1
-            while True:
-                url = urlparse(b)._replace(query=urlencode({"page": page})).geturl()
-                r = http(url, s)
-                page += 1
-                if not r:
-                    break
-                links = [
-                    urljoin(BASE_URL, u)
-                    for i in range(16)
-                    for u in html.fromstring(r.text).xpath(
-                        f'//a[@data-testid="product-result-{i}"]/@href'
-                    )
-                ]
-                if not links:
-                    break
-                urls.update(links)
+def parse_brand_links(body, enc="utf-8"):
+    return [urljoin(BASE_URL, u) for u in BRAND_HREFS(html_doc(body, enc))]
+
+# every product-result-<n> card, however many the page holds (numeric suffix only)
+PRODUCT_HREFS = etree.XPath(
+    '//a[starts-with(@data-testid, "product-result-") and string-length(@data-testid) > 15 and '
+    'translate(substring-after(@data-testid, "product-result-"), "0123456789", "") = ""]/@href'
+)
 
-    with ThreadPoolExecutor(WORKERS) as pool:
-        pool.map(worker, slices)
+PAGER_HREFS = etree.XPath('//a[contains(@href, "page=")]/@href')
 
-    logging.info("harvested %d detail URLs", len(urls))
-    return urls
+def result_page(body, enc="utf-8", path=None):
+    """(product URLs, page count or None) from one search-results page of the
+    brand at `path`: one DOM parse, compiled XPaths for the cards and the count."""
+    doc = html_doc(body, enc)
+    return [urljoin(BASE_URL, u) for u in PRODUCT_HREFS(doc)], page_count(doc, path)
 
+def page_count(doc, path=None):
+    # the highest ?page= the pager links to on this brand's path (a windowed
+    # pager's later pages extend it further)
+    last = 0
+    for h in PAGER_HREFS(doc):
+        u = urlparse(h)
+        if u.path in ("", path):
+            last = max([last] + [int(v) for v in parse_qs(u.query).get("page", ()) if v.isdigit()])
+    return last or None
+
+def next_pages(known, b, page, links, pages):
+    """(page, probe) tasks to queue for brand `b` once `page` came back.
+    known[b] is the highest page queued so far. A page count queues exactly
+    the pages up to it; with none, a page with cards probes the next one."""
+    last = known.get(b, 1)
+    if pages:
+        known[b] = max(last, pages)
+        return [(p, False) for p in range(last + 1, pages + 1)]
+    if links and page == last:
+        known[b] = page + 1
+        return [(page + 1, True)]
+    return []
+
+def page_url(brand, page):
+    return urlparse(brand)._replace(query=urlencode({"page": page})).geturl()
+
+def fetch_results(brand, page, sess, probe=False):
+    """One result page → (product URLs, total pages or None). Within the
+    known page count only a permanent 4xx or a page without cards means
+    "no more results", and anything else that outlives the retry policy fails
+    the harvest; a probe past the last known page gets one attempt and any
+    failure there is the end of the results."""
+    url = page_url(brand, page)
+    f = http_fetch(url, sess, retries=1 if probe else RETRIES)
+    if f.outcome == "gone" or (probe and not f.resp):
+        return [], None              # past the last page (or the brand is gone)
+    if not f.resp:                   # a silent gap would let pruning delete the brand
+        raise RuntimeError(f"result page {f.outcome} ({f.status}, {f.attempts} tries) {url}")
+    return parse(result_page, f.resp.content, charset(f.resp), urlparse(brand).path)
+
+def harvest(emit):
+    """Crawl every brand's result pages, calling emit(url) per product link found.
+    Workers share one queue of (brand, page, probe) tasks; next_pages() decides
+    what each fetched page adds, so long brands never pin a single thread."""
+    tasks, errors = queue.Queue(), []
+    known, lock = {}, threading.Lock()
+    for b in brand_links(session()):
+        tasks.put((b, 1, False))
+
+    def worker():
+        s = session()
+        while (task := tasks.get()) is not _STOP:
+            try:
+                b, page, probe = task
+                links, pages = fetch_results(b, page, s, probe)
+                with lock:
+                    more = next_pages(known, b, page, links, pages)
+                # enqueue before task_done → join() waits for the new tasks
+                for p, pr in more:
+                    tasks.put((b, p, pr))
+                for u in links:
+                    emit(u)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                tasks.task_done()
+
+    with ThreadPoolExecutor(MAX_WORKERS) as pool:     # CONTROL decides how many are active
+        for _ in range(MAX_WORKERS):
+            pool.submit(worker)
+        tasks.join()
+        for _ in range(MAX_WORKERS):
+            tasks.put(_STOP)
+    if errors:
+        raise errors[0]
+
+def iter_links(seen=None):
+    """Yield detail URLs as soon as they are harvested, deduped on the fly.
+    `seen` (if given) ends up holding the full harvested set."""
+    seen = set() if seen is None else seen
+    found, failed = queue.Queue(), []
+
+    def run():
+        try:
+            harvest(found.put)
+        except Exception as e:
+            failed.append(e)
+        finally:
+            found.put(_STOP)
+
+    threading.Thread(target=run, name="harvest", daemon=True).start()
+    while (u := found.get()) is not _STOP:
+        if u not in seen:
+            seen.add(u)
+            yield u
+    if failed:                   # an incomplete set must not drive pruning
+        raise RuntimeError("harvest failed") from failed[0]
+    logging.info("harvested %d detail URLs", len(seen))
 # ───── scrape detail JSON ─────
 def api_endpoint(bid, cid):
     return f"{BASE_URL}/_next/data/{bid}/voorraad/{cid}.json?id={cid}"
 
-def scrape_detail(tlocal, url, bid):
-    sess = getattr(tlocal, "sess", None)
-    if sess is None:
-        sess = tlocal.sess = requests.Session()
+def car_id(url):
+    return url.rstrip("/").split("/")[-1]
 
-    cid = url.rstrip("/").split("/")[-1]
-    api = api_endpoint(bid, cid)
-    logging.debug("API %s", api)
+def scrape_detail(url, bid, sess=None, cache=None):
+    sess = sess or session()
 
-    r = http(api, sess)
-    if not r:
-        logging.warning("HTTP miss %s", api)
+    cid = car_id(url)
+    logging.debug("API %s", api_endpoint(bid, cid))
+
+    cached = cache.get(cid) if cache else None
+    for _ in range(2):               # once more if a redeploy changed the buildId
+        gen = getattr(bid, "gen", None)
+        api = api_endpoint(bid, cid)
+        f = http_fetch(api, sess, headers=DetailCache.validators(cached))
+        if not (f.status == 404 and gen is not None and bid.miss(gen, url)):
+            break
+    r = detail_response(f, api)
+    if r is None:
         return None
+    if r.status_code == 304 and cached:
+        return cache.reuse(cached, url)
+    return detail_record(parse(decode_detail, r.content, url, cid), r, cid, api, cache)
+
+def detail_response(f, api):
+    """The response worth parsing (or a 304 for a cached record), else None."""
+    if not f.resp:
+        log = logging.info if f.outcome == "gone" else logging.warning
+        log("HTTP %s (%s, %d tries) %s", f.outcome, f.status, f.attempts, api)
+    return f.resp
+
+def decode_detail(body, url, cid):
+    # raw detail JSON → (rec, mismatch), None if it isn't JSON; runs in the parse pool
     try:
-        js = r.json()
+        js = json.loads(body)
     except ValueError:
+        return None
+    return parse_detail(js, url, cid)
+
+def detail_record(parsed, r, cid, api, cache=None):
+    """decode_detail() result → record or None; shared by both engines."""
+    if parsed is None:
         logging.warning("non-JSON for %s", api)
         return None
+    rec, mismatch = parsed
+    if mismatch:
+        log_mismatch(*mismatch)
+    elif rec and cache:
+        cache.put(cid, r.headers, rec)
+    return rec
+
+# ───── conditional-GET cache for detail JSON ─────
+class DetailCache:
+    """sqlite file of {car id: validators + parsed record}. Keyed by car id,
+    not by the buildId-bearing URL, so it survives deploys; a 304 reuses the
+    stored record without downloading or parsing the JSON again."""
+
+    COMMIT_EVERY = 200
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS detail "
+            "(cid TEXT PRIMARY KEY, etag TEXT, modified TEXT, rec TEXT)"
+        )
+        self.lock = threading.Lock()
+        self.pending = self.hits = 0
+
+    def get(self, cid):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, modified, rec FROM detail WHERE cid = ?", (cid,)
+            ).fetchone()
+        return row
+
+    @staticmethod
+    def validators(entry):
+        if not entry:
+            return None
+        etag, modified, _ = entry
+        hdrs = {}
+        if etag:
+            hdrs["If-None-Match"] = etag
+        if modified:
+            hdrs["If-Modified-Since"] = modified
+        return hdrs
+
+    def put(self, cid, headers, rec):
+        etag, modified = headers.get("etag"), headers.get("last-modified")
+        if not (etag or modified):
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO detail VALUES (?, ?, ?, ?)",
+                (cid, etag, modified, json.dumps(rec, ensure_ascii=False)),
+            )
+            self.pending += 1
+            if self.pending >= self.COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+
+    def reuse(self, entry, url):
+        rec = json.loads(entry[2])
+        with self.lock:
+            self.hits += 1
+        if rec["url"] != url:            # same car reached through another link
+            rec["url"] = url
+            rec["content_hash"] = record_hash(rec)
+        return rec
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+def log_mismatch(cid, img_cid, image_url):
+    # log mismatch for later manual look-up (workers only enqueue)
+    mismatch_log().put((cid, img_cid, image_url))
+    logging.info("IMG-CID mismatch  listing:%s  img:%s", cid, img_cid)
+
+# ───── buffered mismatch sink ─────
+_mismatches, _mismatch_lock = None, threading.Lock()
+
+class MismatchLog(threading.Thread):
+    """One thread owns debug_mismatch.csv: workers enqueue rows, the thread
+    appends them in one write every MISMATCH_FLUSH seconds (no per-event
+    open/close, no interleaved rows). With `table` set the same batch is
+    COPYed into Postgres over the thread's own connection."""
+
+    COLS = ("listing_id", "img_car_id", "image_url")
+
+    def __init__(self, path=MISMATCH_CSV, table=MISMATCH_TABLE, dsn=None):
+        super().__init__(name="mismatch-log", daemon=True)
+        self.path, self.table, self.dsn = path, table, dsn or DB_DSN
+        self.q = queue.Queue()
+        self.count = 0
+        with open(path, "w", newline="") as fh:      # fresh file per run
+            csv.writer(fh).writerow(self.COLS)
 
+    def put(self, row):
+        self.q.put(row)
+
+    def close(self):
+        self.q.put(_STOP)
+        self.join()
+
+    def flush(self, rows, conn):
+        if not rows:
+            return
+        with open(self.path, "a", newline="") as fh:
+            csv.writer(fh).writerows(rows)
+        self.count += len(rows)
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    copy_rows(cur, self.table, self.COLS, rows)
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                logging.exception("mismatch mirror to %s failed", self.table)
+
+    def run(self):
+        conn = None
+        if self.table:
+            try:
+                conn = psycopg2.connect(self.dsn)
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {self.table} (listing_id text, "
+                        f"img_car_id text, image_url text, seen_at timestamptz DEFAULT now())"
+                    )
+                conn.commit()
+            except psycopg2.Error:
+                logging.exception("mismatch table unavailable – CSV only")
+                conn = None
+        rows, due, done = [], time.monotonic() + MISMATCH_FLUSH, False
+        while not done:
+            try:
+                row = self.q.get(timeout=max(0.0, due - time.monotonic()))
+                if row is _STOP:
+                    done = True
+                else:
+                    rows.append(row)
+            except queue.Empty:
+                pass
+            if done or time.monotonic() >= due:
+                self.flush(rows, conn)
+                rows, due = [], time.monotonic() + MISMATCH_FLUSH
+        if conn:
+            conn.close()
+
+def mismatch_log():
+    # started lazily, so importing the module no longer truncates the CSV
+    global _mismatches
+    with _mismatch_lock:
+        if _mismatches is None:
+            _mismatches = MismatchLog()
+            _mismatches.start()
+        return _mismatches
+
+def close_mismatch_log():
+    global _mismatches
+    with _mismatch_lock:
+        sink, _mismatches = _mismatches, None
+    if sink:
+        sink.close()
+    return sink.count if sink else 0
+
+def _pval(pd, key):
+    f = pd.get(key)
+    return (f.get("value") or f.get("name")) if f else None
+
+def _field_getter(kind, *args):
+    # one FIELD_SPEC entry → getter(prod, pd, url, cid, imgs)
+    if kind == "pd":
+        key, = args
+        return lambda prod, pd, url, cid, imgs: _pval(pd, key)
+    if kind == "words":
+        return lambda prod, pd, url, cid, imgs: " ".join([str(_pval(pd, k)) for k in args]).strip()
+    if kind == "prod":
+        def first(prod, pd, url, cid, imgs):
+            for k in args:
+                if v := prod.get(k):
+                    return v
+            return v
+        return first
+    if kind == "dealer":
+        key, = args
+        return lambda prod, pd, url, cid, imgs: (prod.get("dealer") or {}).get(key)
+    if kind == "join":
+        key, = args
+        return lambda prod, pd, url, cid, imgs: ", ".join(prod.get(key) or ()) or None
+    if kind == "const":
+        value, = args
+        return lambda prod, pd, url, cid, imgs: value
+    if kind == "url":
+        return lambda prod, pd, url, cid, imgs: url
+    if kind == "cid":
+        return lambda prod, pd, url, cid, imgs: cid
+    if kind == "images":
+        return lambda prod, pd, url, cid, imgs: imgs
+    raise ValueError(f"unknown field kind {kind!r}")
+
+def compile_spec(spec, fields=ALL_FIELDS):
+    """FIELD_SPEC → extract(prod, pd, url, cid, imgs) returning the record dict
+    in `fields` order. Spec entries are resolved into getters once, here, not
+    per listing."""
+    if missing := [f for f in fields if f not in spec]:
+        raise ValueError(f"no FIELD_SPEC entry for {missing}")
+    getters = [(f, _field_getter(*spec[f])) for f in fields]
+
+    def extract(prod, pd, url, cid, imgs):
+        return {f: get(prod, pd, url, cid, imgs) for f, get in getters}
+    return extract
+
+extract_detail = compile_spec(FIELD_SPEC)
+IMG_CAR_ID = re.compile(r"/products/([0-9]+)/")
+
+def parse_detail(js, url, cid):
+    """Detail JSON → (record or None, mismatch row or None). No I/O, so any
+    engine (threads, asyncio) can share it."""
     inner = js.get("pageProps", {}).get("pageProps", {})
     prod = inner.get("product")
     pd = prod.get("product_data") if prod else None
     if not prod or not pd:
-        return None
+        return None, None
 
     imgs = prod.get("afbeeldingen", [])
+    if not imgs:
+        return None, None            # nothing to store without images
     # verify first image belongs to same car
-    if imgs:
-        m = re.search(r'/products/([0-9]+)/', imgs[0])
-        if not m or m.group(1) != cid:
-            # log mismatch for later manual look-up
-            with open(MISMATCH_CSV, "a", newline="") as fh:
-                csv.writer(fh).writerow([cid, m.group(1) if m else "NONE", imgs[0]])
-            logging.info("IMG-CID mismatch  listing:%s  img:%s", cid, m.group(1) if m else "NONE")
-            return None
+    m = IMG_CAR_ID.search(imgs[0])
+    if not m or m.group(1) != cid:
+        return None, (cid, m.group(1) if m else "NONE", imgs[0])
 
-    def pval(pdata, key):
-        fld = pdata.get(key, {})
-        return fld.get("value") or fld.get("name")
-
-    rec = dict.fromkeys(ALL_FIELDS)
-    rec.update(
-        {
-            # CORE
-            "url": url,
-            "title": f"{pval(pd,'merk')} {pval(pd,'model')}".strip(),
-            "subtitle": pval(pd, "type"),
-            "financial_lease_price": prod.get("from_price_business") or prod.get("from_price"),
-            "financial_lease_term": "o.b.v. 72 mnd looptijd",
-            "advertentienummer": cid,
-            "merk": pval(pd, "merk"),
-            "model": pval(pd, "model"),
-            "bouwjaar": pval(pd, "bouwjaar"),
-            "km_stand": pval(pd, "km_stand"),
-            "transmissie": pval(pd, "transmissie"),
-            "prijs": pval(pd, "prijs"),
-            "brandstof": pval(pd, "brandstof"),
-            "btw_marge": pval(pd, "btw_marge"),
-            "opties_accessoires": ", ".join(prod.get("accessoires", [])) or None,
-            "address": prod.get("dealer", {}).get("Plaats_dealer"),
-            # EXTRA
-            **{k: pval(pd, k) for k in EXTRA},
-            # images field
-            "images": imgs,
-        }
-    )
+    rec = extract_detail(prod, pd, url, cid, imgs)
+    rec["content_hash"] = record_hash(rec)
     logging.debug("OK %s imgs:%d", cid, len(imgs))
-    return rec if imgs else None
+    return rec, None
 
 # ───── DB helpers (STRICT alignment) ─────
 def insert_listing_rows(cur, rows):
-    ids = []
-    for r in rows:               # one-by-one to keep order 1:1
-        cur.execute(INS_LISTINGS, (r,))
-        ids.append(cur.fetchone()[0])
-    return ids
+    """Multi-row INSERT; returns {advertentienummer: id} (RETURNING order is not guaranteed)."""
+    out = psycopg2.extras.execute_values(
+        cur, INS_LISTINGS, rows, page_size=INSERT_PAGE, fetch=True
+    )
+    return {str(a): i for a, i in out}
 
-def bulk_insert(cur, recs):
-    rows = [
-        tuple(clip(r[f], f) if f != "images" else None for f in ALL_FIELDS if f != "images")
-        for r in recs
-    ]
-    ids = insert_listing_rows(cur, rows)
-
-    img_rows = [(u, lid) for r, lid in zip(recs, ids) for u in r["images"]]
-    if img_rows:
+def copy_field(v):
+    if v is None:
+        return "\\N"
+    return (
+        str(v).replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+def copy_rows(cur, table, cols, rows, chunk=IMAGE_CHUNK):
+    # one COPY per `chunk` rows keeps the text buffer bounded
+    for part in itertools.batched(rows, chunk):
         buf = io.StringIO()
-        csv.writer(buf, delimiter="\t", lineterminator="\n").writerows(img_rows)
+        buf.writelines("\t".join(map(copy_field, r)) + "\n" for r in part)
         buf.seek(0)
-        cur.copy_from(buf, "car_images", columns=("image_url", "car_listing_id"))
+        cur.copy_from(buf, table, columns=cols)
+
+def stage_rows(cur, stage, table, cols, rows):
+    # temp table with the target's column types, emptied at every commit
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DELETE ROWS "
+        f"AS SELECT {', '.join(cols)} FROM {table} WITH NO DATA"
+    )
+    cur.execute(f"TRUNCATE {stage}")
+    copy_rows(cur, stage, cols, rows)
+
+def copy_listing_rows(cur, rows):
+    """COPY into a temp staging table, then one INSERT…SELECT; returns {advertentienummer: id}."""
+    cols = ", ".join(LISTING_COLS)
+    stage_rows(cur, STAGE_LISTINGS, "car_listings", LISTING_COLS, rows)
+    cur.execute(
+        f"INSERT INTO car_listings ({cols}) SELECT {cols} FROM {STAGE_LISTINGS} "
+        f"RETURNING advertentienummer, id"
+    )
+    return {str(a): i for a, i in cur.fetchall()}
+
+# correlate on the (clipped) advertentienummer, never on row position
+listing_key = lambda r: str(clip(r["advertentienummer"], "advertentienummer"))
+
+def bulk_insert(cur, recs):
+    recs = list({listing_key(r): r for r in recs}.values())  # 1 row per car
+    rows = [tuple(clip(r[f], f) for f in LISTING_COLS) for r in recs]
+    load = copy_listing_rows if LOADER == "copy" else insert_listing_rows
+    ids = load(cur, rows)
+
+    img_rows = ((u, ids[listing_key(r)]) for r in recs for u in r["images"])
+    copy_rows(cur, "car_images", IMAGE_COLS, img_rows)
+
+def ensure_schema(cur):
+    cur.execute("ALTER TABLE car_listings ADD COLUMN IF NOT EXISTS content_hash text")
+
+def load_hashes(cur):
+    cur.execute("SELECT advertentienummer, content_hash FROM car_listings")
+    return {str(a): h for a, h in cur.fetchall()}
+
+def upsert_batch(cur, recs, known=None):
+    """Incremental load: insert new cars, update changed ones, diff their images.
+    Cars whose content_hash matches `known` are skipped without touching the DB.
+    Returns (inserted, updated, images_added, images_removed)."""
+    recs = list({listing_key(r): r for r in recs}.values())
+    if known:
+        recs = [r for r in recs if known.get(listing_key(r)) != r["content_hash"]]
+    if not recs:
+        return 0, 0, 0, 0
+    rows = [tuple(clip(r[f], f) for f in LISTING_COLS) for r in recs]
+    stage_rows(cur, STAGE_LISTINGS, "car_listings", LISTING_COLS, rows)
+
+    cols = ", ".join(LISTING_COLS)
+    s_cols = ", ".join(f"s.{c}" for c in LISTING_COLS)
+    cur.execute(
+        f"UPDATE car_listings l SET ({cols}) = ({s_cols}) FROM {STAGE_LISTINGS} s "
+        f"WHERE l.advertentienummer = s.advertentienummer "
+        f"AND l.content_hash IS DISTINCT FROM s.content_hash"
+    )
+    updated = cur.rowcount
+    cur.execute(
+        f"INSERT INTO car_listings ({cols}) SELECT {cols} FROM {STAGE_LISTINGS} s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM car_listings l "
+        f"WHERE l.advertentienummer = s.advertentienummer)"
+    )
+    inserted = cur.rowcount
+    cur.execute(
+        f"SELECT l.advertentienummer, l.id FROM car_listings l "
+        f"JOIN {STAGE_LISTINGS} s USING (advertentienummer)"
+    )
+    ids = {str(a): i for a, i in cur.fetchall()}
+
+    # images: stage the wanted set, then delete/insert only the difference
+    img_rows = ((u, ids[listing_key(r)]) for r in recs for u in r["images"])
+    stage_rows(cur, STAGE_IMAGES, "car_images", IMAGE_COLS, img_rows)
+    cur.execute(
+        f"DELETE FROM car_images i WHERE i.car_listing_id = ANY(%s) "
+        f"AND NOT EXISTS (SELECT 1 FROM {STAGE_IMAGES} s "
+        f"WHERE s.car_listing_id = i.car_listing_id AND s.image_url = i.image_url)",
+        (list(ids.values()),),
+    )
+    removed = cur.rowcount
+    cur.execute(
+        f"INSERT INTO car_images (image_url, car_listing_id) "
+        f"SELECT DISTINCT s.image_url, s.car_listing_id FROM {STAGE_IMAGES} s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM car_images i "
+        f"WHERE i.car_listing_id = s.car_listing_id AND i.image_url = s.image_url)"
+    )
+    return inserted, updated, cur.rowcount, removed
+
+def prune_listings(cur, live_ids):
+    """Delete listings (and their images) whose advertentienummer was not harvested."""
+    live = sorted(live_ids)
+    cur.execute(
+        "DELETE FROM car_images WHERE car_listing_id IN ("
+        "SELECT id FROM car_listings WHERE advertentienummer::text <> ALL(%s))",
+        (live,),
+    )
+    cur.execute("DELETE FROM car_listings WHERE advertentienummer::text <> ALL(%s)", (live,))
+    return cur.rowcount
+
+# ───── streaming pipeline: detail workers → bounded queue → DB writer ─────
+class Spool:
+    """Append-only, gzip JSON-lines log of scraped records in numbered
+    segments. Workers append before the record is queued for the DB, so a
+    crash or DB outage loses nothing already fetched; commit(seqs) deletes
+    every closed segment whose records are all in Postgres. Leftovers are
+    loaded by replay_spool() (--replay-spool, and at the start of the next
+    run); LAST_COMMIT names the newest run that committed, so segments of
+    older runs are known to be superseded."""
+
+    LAST_COMMIT = "last_commit"
+
+    def __init__(self, path, segment=SPOOL_SEGMENT):
+        os.makedirs(path, exist_ok=True)
+        self.path, self.segment = path, segment
+        self.run = time.strftime("%Y%m%d-%H%M%S")
+        self.lock = threading.Lock()
+        self.seq = self.mark = 0         # last appended / last contiguously committed
+        self.ahead = set()               # committed seqs above the mark
+        self.closed = []                 # (last seq, file) of full segments
+        self.fh, self.name, self.count = None, None, 0
+        self.marked = False
+
+    def append(self, rec):
+        with self.lock:
+            if self.fh is None:
+                self.name = os.path.join(self.path, f"{self.run}-{self.seq + 1:09d}.jsonl.gz")
+                self.fh, self.count = gzip.open(self.name, "at", encoding="utf-8"), 0
+            self.fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self.fh.flush()              # sync-flush: the line survives a crash
+            self.seq += 1
+            self.count += 1
+            if self.count >= self.segment:
+                self._roll()
+            return self.seq
+
+    def _roll(self):
+        self.fh.close()
+        self.closed.append((self.seq, self.name))
+        self.fh = None
+
+    def commit(self, seqs):
+        with self.lock:
+            if seqs and not self.marked:
+                Spool.mark_committed(self.path, self.run)
+                self.marked = True
+            self.ahead.update(s for s in seqs if s)
+            while self.mark + 1 in self.ahead:
+                self.mark += 1
+                self.ahead.discard(self.mark)
+            while self.closed and self.closed[0][0] <= self.mark:
+                os.remove(self.closed.pop(0)[1])
+
+    def close(self):
+        with self.lock:
+            if self.fh is not None:
+                self._roll()
+        self.commit(())
+
+    @staticmethod
+    def segments(path):
+        return sorted(glob.glob(os.path.join(path, "*.jsonl.gz")))
+
+    @staticmethod
+    def run_of(name):
+        return os.path.basename(name).rsplit("-", 1)[0]
+
+    @staticmethod
+    def last_commit(path):
+        try:
+            with open(os.path.join(path, Spool.LAST_COMMIT)) as fh:
+                return fh.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def mark_committed(path, run):
+        if run > Spool.last_commit(path):           # run ids are sortable timestamps
+            tmp = os.path.join(path, Spool.LAST_COMMIT + ".tmp")
+            with open(tmp, "w") as fh:
+                fh.write(run)
+            os.replace(tmp, os.path.join(path, Spool.LAST_COMMIT))
+
+    @staticmethod
+    def read(name):
+        recs = []
+        try:
+            with gzip.open(name, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    recs.append(json.loads(line))
+        except (EOFError, OSError, zlib.error, ValueError):
+            logging.warning("spool %s: torn tail after %d records", name, len(recs))
+        return recs
+
+def replay_spool(conn, path=SPOOL_DIR, on_commit=None):
+    """Load leftover spool segments into Postgres through the (idempotent)
+    upsert path, deleting each segment once its transaction commits and
+    passing its records to on_commit (Checkpoint.mark_done, so a resumed
+    run does not fetch – and, in reload mode, insert – them again). Segments
+    of a run older than the last committed one are dropped unread: that run's
+    cars have since been re-scraped, and replaying would roll them back."""
+    cur = conn.cursor()
+    ensure_schema(cur)
+    known = load_hashes(cur)
+    total = 0
+    for name in Spool.segments(path):
+        run = Spool.run_of(name)
+        if run < Spool.last_commit(path):
+            logging.warning("dropping %s – superseded by a later committed run", os.path.basename(name))
+            os.remove(name)
+            continue
+        recs = Spool.read(name)
+        for chunk in itertools.batched(recs, PARSE_CHUNK):
+            upsert_batch(cur, chunk, known)
+        conn.commit()
+        if on_commit:
+            on_commit(recs)
+        Spool.mark_committed(path, run)
+        os.remove(name)
+        total += len(recs)
+        logging.info("replayed %s – %d records", os.path.basename(name), len(recs))
+    cur.close()
+    return total
+
+class DbWriter(threading.Thread):
+    """Single writer thread: drains scraped records from a bounded queue and
+    flushes them through `store(cur, recs)` every PARSE_CHUNK records or
+    FLUSH_SECS seconds, committing after each flush. With a Spool, every
+    record is logged on put() and released from the spool after its commit."""
+
+    def __init__(self, conn, store, on_commit=None, spool=None):
+        super().__init__(name="db-writer", daemon=True)
+        self.q = queue.Queue(maxsize=WRITE_QUEUE)
+        self.conn, self.store, self.on_commit = conn, store, on_commit
+        self.spool = spool
+        self.total = self.batches = 0
+        self.error = None
+
+    def put(self, rec):
+        if self.error:
+            raise RuntimeError("DB writer failed") from self.error
+        seq = self.spool.append(rec) if self.spool else None
+        self.q.put((seq, rec))
+
+    def close(self):
+        self.q.put(_STOP)
+        self.join()
+        if self.error:
+            raise RuntimeError("DB writer failed") from self.error
+
+    def flush(self, cur, items):
+        if not items:
+            return
+        recs = [r for _, r in items]
+        self.batches += 1
+        logging.info("[batch %d] %d records", self.batches, len(recs))
+        self.store(cur, recs)
+        self.conn.commit()
+        if self.spool:
+            self.spool.commit([s for s, _ in items])
+        if self.on_commit:
+            self.on_commit(recs)
+        self.total += len(recs)
+        logging.info("batch committed – running total %d", self.total)
+
+    def run(self):
+        cur = self.conn.cursor()
+        buf, due = [], time.monotonic() + FLUSH_SECS
+        try:
+            while True:
+                try:
+                    item = self.q.get(timeout=max(0.0, due - time.monotonic()))
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+                if item is not None:
+                    buf.append(item)
+                if len(buf) >= PARSE_CHUNK or time.monotonic() >= due:
+                    self.flush(cur, buf)
+                    buf, due = [], time.monotonic() + FLUSH_SECS
+            self.flush(cur, buf)
+        except Exception as e:
+            logging.exception("DB writer died")
+            self.error = e
+            while self.q.get() is not _STOP:    # keep producers unblocked
+                pass
+        finally:
+            cur.close()
+
+def scrape_all(urls, bid, writer, cache=None):
+    """Feed URLs to the detail pool; every record goes straight to the writer."""
+    slots = threading.BoundedSemaphore(MAX_WORKERS * 4)    # cap queued futures
+
+    def job(u):
+        try:
+            rec = scrape_detail(u, bid, cache=cache)
+            if rec:
+                writer.put(rec)
+        except Exception:
+            if not writer.error:
+                logging.exception("detail failed %s", u)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(MAX_WORKERS) as pool:     # CONTROL decides how many are active
+        for u in urls:
+            if writer.error:
+                break
+            slots.acquire()
+            pool.submit(job, u)
+
+    # cars that 404'd just before a buildId refresh was detected
+    if isinstance(bid, BuildId) and (again := bid.take_retry()) and not writer.error:
+        scrape_all(again, bid, writer, cache)
+
+# ───── asyncio engine (stdlib HTTP/1.1 client, keep-alive pool) ─────
+class AsyncResponse:
+    """Just enough of requests.Response for the shared parsers."""
+
+    def __init__(self, status, headers, content):
+        self.status_code, self.headers, self.content = status, headers, content
+
+class AsyncHTTP:
+    """Minimal GET-only HTTP/1.1 client on asyncio streams with per-host
+    keep-alive connections (Content-Length, chunked and gzip bodies)."""
+
+    REDIRECTS = {301, 302, 303, 307, 308}
+    MAX_HOPS = 5
+
+    def __init__(self, timeout=15):
+        self.timeout = timeout
+        self.idle = {}
+        self.requests = self.connections = 0
+        self.ctx = ssl.create_default_context()
+
+    async def _open(self, key):
+        scheme, host, port = key
+        if self.idle.get(key):
+            return self.idle[key].pop()
+        self.connections += 1
+        ctx = self.ctx if scheme == "https" else None
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ctx), self.timeout)
+
+    async def get(self, url, headers=None):
+        """GET that follows same-host redirects (up to MAX_HOPS), as requests
+        does for the thread engine; anything else comes back as the 3xx."""
+        for _ in range(self.MAX_HOPS):
+            resp = await self._get(url, headers)
+            loc = resp.headers.get("location")
+            if resp.status_code not in self.REDIRECTS or not loc:
+                break
+            nxt = urljoin(url, loc)
+            if urlparse(nxt).netloc != urlparse(url).netloc:
+                break
+            url = nxt
+        return resp
+
+    async def _get(self, url, headers=None):
+        u = urlparse(url)
+        key = (u.scheme, u.hostname, u.port or (443 if u.scheme == "https" else 80))
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        hdrs = {**HEADERS, **(headers or {}), "Host": u.netloc,
+                "Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        req = f"GET {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in hdrs.items()) + "\r\n"
+        self.requests += 1
+        for attempt in range(2):             # a pooled socket may have been closed by the server
+            fresh = not self.idle.get(key)
+            reader, writer = await self._open(key)
+            try:
+                writer.write(req.encode("latin-1"))
+                resp, reusable = await asyncio.wait_for(self._read(reader), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if fresh or attempt:
+                    raise requests.ConnectionError(str(e)) from e
+                continue
+            except BaseException:
+                writer.close()
+                raise
+            if reusable:
+                self.idle.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+            return resp
+
+    async def _read(self, reader):
+        status = int((await reader.readuntil(b"\r\n")).split()[1])
+        headers = {}
+        while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        reusable = headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", ""):
+            parts = []
+            while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                parts.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            while await reader.readuntil(b"\r\n") != b"\r\n":   # trailers
+                pass
+            body = b"".join(parts)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif status in (204, 304) or 100 <= status < 200:
+            body = b""
+        else:
+            body, reusable = await reader.read(), False
+        enc = headers.get("content-encoding", "")
+        if enc in ("gzip", "deflate"):
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS if enc == "gzip" else zlib.MAX_WBITS)
+        return AsyncResponse(status, headers, body), reusable
+
+    async def close(self):
+        for conns in self.idle.values():
+            for _, w in conns:
+                w.close()
+        self.idle.clear()
+
+class AsyncGate:
+    """asyncio front for an Aimd controller: waiting happens on the loop."""
+
+    def __init__(self, ctl):
+        self.ctl, self.cond = ctl, asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(self.ctl.try_acquire)
+
+    async def release(self, latency, outcome):
+        self.ctl.release(latency, outcome)
+        async with self.cond:
+            self.cond.notify_all()
+
+async def afetch(client, url, gate, headers=None, retries=RETRIES):
+    # async twin of http_fetch(); backoff sleeps happen outside the gate
+    extra, status = headers, None
+    for attempt in range(retries):
+        headers, outcome = None, "failed"
+        await LIMITER.wait_async()
+        await gate.acquire()
+        t0 = time.monotonic()
+        try:
+            r = await client.get(url, extra)
+        except (requests.RequestException, OSError, asyncio.TimeoutError, ValueError, zlib.error):
+            pass
+        else:
+            status, headers, outcome = r.status_code, r.headers, classify(r.status_code)
+        finally:
+            await gate.release(time.monotonic() - t0, outcome)
+        if RECORDER and outcome in ("ok", "gone"):
+            RECORDER.save(url, r)
+        if outcome == "ok":
+            return Fetch(r, outcome, status, attempt + 1)
+        if outcome == "gone":
+            return Fetch(None, outcome, status, attempt + 1)
+        if attempt + 1 < retries:
+            await asyncio.sleep(retry_delay(attempt, headers))
+    return Fetch(None, outcome, status, retries)
+
+async def ahttp(client, url, gate):
+    return (await afetch(client, url, gate)).resp
+
+async def afetch_results(client, gate, brand, page, probe=False):
+    # async twin of fetch_results()
+    url = page_url(brand, page)
+    f = await afetch(client, url, gate, retries=1 if probe else RETRIES)
+    if f.outcome == "gone" or (probe and not f.resp):
+        return [], None
+    if not f.resp:
+        raise RuntimeError(f"result page {f.outcome} ({f.status}, {f.attempts} tries) {url}")
+    return await aparse(result_page, f.resp.content, charset(f.resp), urlparse(brand).path)
+
+async def ascrape_detail(client, gate, url, bid, cache=None):
+    loop = asyncio.get_running_loop()
+    cid = car_id(url)
+    cached = cache.get(cid) if cache else None
+    for _ in range(2):
+        gen = getattr(bid, "gen", None)
+        api = api_endpoint(bid, cid)
+        f = await afetch(client, api, gate, DetailCache.validators(cached))
+        # the buildId re-fetch is blocking I/O → run it off the loop
+        if not (f.status == 404 and gen is not None
+                and await loop.run_in_executor(None, bid.miss, gen, url)):
+            break
+    r = detail_response(f, api)
+    if r is None:
+        return None
+    if r.status_code == 304 and cached:
+        return cache.reuse(cached, url)
+    return detail_record(await aparse(decode_detail, r.content, url, cid), r, cid, api, cache)
+
+async def run_async(bid, writer, seen, cache=None, skip=(), harvest=True,
+                    concurrency=ASYNC_CONCURRENCY):
+    """Harvest + detail scraping as coroutines on one event loop. An AIMD
+    controller adapts the in-flight limit up to `concurrency`; records go to
+    the same DbWriter. URLs already in `seen` (resume) are fetched first; car
+    ids in `skip` are harvested but not fetched."""
+    loop = asyncio.get_running_loop()
+    ctl = Aimd(WORKERS, 1, concurrency)
+    client, gate = AsyncHTTP(), AsyncGate(ctl)
+    todo = asyncio.Queue(maxsize=concurrency * 4)
+    errors, known = [], {}
+
+    async def crawl(b, page, probe):
+        try:
+            links, pages = await afetch_results(client, gate, b, page, probe)
+        except Exception as e:
+            errors.append(e)         # keep crawling, like harvest(); fail the run at the end
+            return
+        more = [crawl(b, p, pr) for p, pr in next_pages(known, b, page, links, pages)]
+        for u in links:
+            if u not in seen:
+                seen.add(u)
+                if car_id(u) not in skip:
+                    await todo.put(u)
+        await asyncio.gather(*more)
+
+    async def detail_worker():
+        while (u := await todo.get()) is not _STOP:
+            if writer.error:
+                continue                     # drain; DbWriter.close() raises
+            try:
+                rec = await ascrape_detail(client, gate, u, bid, cache)
+                if rec:
+                    await loop.run_in_executor(None, writer.put, rec)
+            except Exception:
+                if not writer.error:
+                    logging.exception("detail failed %s", u)
+
+    async def drain():
+        for _ in range(concurrency):
+            await todo.put(_STOP)
+        await asyncio.gather(*workers)
+
+    workers = [asyncio.create_task(detail_worker()) for _ in range(concurrency)]
+    try:
+        for u in list(seen):
+            if car_id(u) not in skip:
+                await todo.put(u)
+        if harvest:
+            r = await ahttp(client, urljoin(BASE_URL, "/merken"), gate)
+            if not r:
+                raise RuntimeError("brand index unavailable")
+            await asyncio.gather(*(crawl(b, 1, False) for b in parse_brand_links(r.content, charset(r))))
+            logging.info("harvested %d detail URLs%s", len(seen), " (incomplete)" if errors else "")
+        await drain()
+        # cars that 404'd just before a buildId refresh was detected
+        while isinstance(bid, BuildId) and (again := bid.take_retry()):
+            workers = [asyncio.create_task(detail_worker()) for _ in range(concurrency)]
+            for u in again:
+                await todo.put(u)
+            await drain()
+        if errors:                   # an incomplete set must not drive pruning
+            raise RuntimeError("harvest failed") from errors[0]
+    finally:
+        if not all(w.done() for w in workers):
+            await drain()
+        await client.close()
+        logging.info("async controller: %s", ctl)
+        logging.info("async pool: %d requests over %d connections", client.requests, client.connections)
+
+# ───── checkpoint / --resume ─────
+class _Journal(set):
+    # harvested-URL set that appends every new member to links.txt
+    def __init__(self, items, fh, lock):
+        super().__init__(items)
+        self.fh, self.lock = fh, lock
+
+    def add(self, u):
+        if u in self:
+            return
+        super().add(u)
+        with self.lock:
+            self.fh.write(u + "\n")
+            self.fh.flush()
+
+class Checkpoint:
+    """Run progress in CHECKPOINT_DIR: state.json (buildId, mode, harvest
+    complete?), links.txt (harvested URLs, appended as found) and done.txt
+    (car ids, appended after each DB commit). A fresh run wipes it; --resume
+    picks it up; a finished run removes it."""
+
+    def __init__(self, path, resume=False):
+        self.path, self.lock = path, threading.Lock()
+        if not resume:
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        self.state = self._read_json("state.json") or {}
+        self.done = set(self._read_lines("done.txt"))
+        self.links = _Journal(
+            self._read_lines("links.txt"), open(self._p("links.txt"), "a"), self.lock
+        )
+        self._done_fh = open(self._p("done.txt"), "a")
+
+    def _p(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_json(self, name):
+        try:
+            with open(self._p(name)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _read_lines(self, name):
+        try:
+            with open(self._p(name)) as fh:
+                return [ln.rstrip("\n") for ln in fh if ln.endswith("\n")]   # skip a torn last line
+        except OSError:
+            return []
+
+    def save(self, **kw):
+        self.state.update(kw)
+        tmp = self._p("state.json.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self._p("state.json"))
+
+    def mark_done(self, recs):
+        cids = [listing_key(r) for r in recs]
+        with self.lock:
+            self.done.update(cids)
+            self._done_fh.write("".join(c + "\n" for c in cids))
+            self._done_fh.flush()
+            os.fsync(self._done_fh.fileno())
+
+    def pending(self, urls):
+        return (u for u in urls if car_id(u) not in self.done)
+
+    def close(self):
+        self.links.fh.close()
+        self._done_fh.close()
+
+    def finish(self):
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+# ───── record / replay (offline, reproducible benchmarks) ─────
+RECORDER = None                  # set by --record DIR
+
+class Recorder:
+    """Captures every final response (200 / permanent 4xx) of a live run:
+    bodies/<sha1> plus an index.jsonl line {path, status, type, body}.
+    The buildId homepage, /merken, result pages and _next/data JSON all go
+    through http_fetch/afetch, so one recorded run is a complete fixture."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = open(os.path.join(path, "index.jsonl"), "a")
+        with open(os.path.join(path, "origin"), "w") as fh:
+            fh.write(BASE_URL)
+
+    def save(self, url, r):
+        if r.status_code == 304:         # no body to keep
+            return
+        u = urlparse(url)
+        key = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        with open(os.path.join(self.path, "bodies", digest), "wb") as fh:
+            fh.write(r.content)
+        line = json.dumps({"path": key, "status": r.status_code,
+                           "type": r.headers.get("content-type", ""), "body": digest})
+        with self.lock:
+            self.index.write(line + "\n")
+            self.index.flush()
+
+    def close(self):
+        self.index.close()
+
+def serve_replay(path, port=8000, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+    """Serve a Recorder fixture over HTTP/1.1 (keep-alive). Each response waits
+    latency ± jitter seconds; error_rate of them answer error_status instead.
+    Absolute links to the recorded origin are rewritten to this server, so
+    `--base-url http://127.0.0.1:<port>` runs the scraper fully offline."""
+    routes = {}
+    with open(os.path.join(path, "index.jsonl")) as fh:
+        for line in fh:
+            e = json.loads(line)
+            routes[e["path"]] = e        # last capture wins
+    with open(os.path.join(path, "origin")) as fh:
+        origin = fh.read().strip().encode()
+
+    class Replay(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def do_GET(self):
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+            e = routes.get(self.path)
+            if random.random() < error_rate:
+                status, ctype, body = error_status, "text/plain", b"injected error"
+            elif e is None:
+                status, ctype, body = 404, "text/plain", b"not recorded"
+            else:
+                with open(os.path.join(path, "bodies", e["body"]), "rb") as fh:
+                    body = fh.read().replace(origin, self.server.origin)
+                status, ctype = e["status"], e["type"]
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    srv = ThreadingHTTPServer(("127.0.0.1", port), Replay)
+    srv.daemon_threads = True
+    srv.origin = f"http://127.0.0.1:{srv.server_port}".encode()
+    logging.info("replaying %d recorded responses on %s", len(routes), srv.origin.decode())
+    return srv
 
 # ───────── MAIN ─────────
-def main():
+def main(argv=None):
+    global BASE_URL, RECORDER
+    ap = argparse.ArgumentParser(description="dtc-lease.nl → Postgres scraper")
+    ap.add_argument("--mode", choices=("reload", "incremental"), default=MODE)
+    ap.add_argument("--engine", choices=("threads", "async"), default=ENGINE)
+    ap.add_argument("--parse-procs", type=int, default=PARSE_PROCS,
+                    help="worker processes for HTML/JSON parsing (0 = parse in the I/O threads)")
+    ap.add_argument("--resume", action="store_true",
+                    help=f"continue the interrupted run recorded in {CHECKPOINT_DIR}/")
+    ap.add_argument("--replay-spool", action="store_true",
+                    help=f"load leftover records from {SPOOL_DIR}/ into Postgres and exit")
+    ap.add_argument("--base-url", default=BASE_URL, help="site root (e.g. a replay server)")
+    ap.add_argument("--record", metavar="DIR", help="capture every response of this run into DIR")
+    ap.add_argument("--serve-replay", metavar="DIR", help="serve a recorded fixture and exit on Ctrl-C")
+    ap.add_argument("--port", type=int, default=8000, help="--serve-replay port")
+    ap.add_argument("--latency", type=float, default=0.0, help="--serve-replay delay per response (s)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="--serve-replay ± delay (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="--serve-replay share of 503s")
+    args = ap.parse_args(argv)
+    mode = args.mode
+
+    BASE_URL = args.base_url.rstrip("/")
+    if args.serve_replay:
+        srv = serve_replay(args.serve_replay, args.port, args.latency, args.jitter, args.error_rate)
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            srv.server_close()
+        return
+    if args.record:
+        RECORDER = Recorder(args.record)
+
+    if args.replay_spool:
+        conn = psycopg2.connect(DB_DSN)
+        # an interrupted run's checkpoint learns which cars are now in Postgres
+        ckpt = Checkpoint(CHECKPOINT_DIR, resume=True) if os.path.isdir(CHECKPOINT_DIR) else None
+        try:
+            n = replay_spool(conn, on_commit=ckpt.mark_done if ckpt else None)
+        finally:
+            if ckpt:
+                ckpt.close()
+        logging.info("DONE – replayed %d spooled records", n)
+        conn.close()
+        return
+
     logging.info("scraper start (DEBUG EDITION)")
-    bid = get_build_id(requests.Session())
-    links = collect_links()
+    mismatch_log()               # fresh debug_mismatch.csv for this run
+    ckpt = Checkpoint(CHECKPOINT_DIR, resume=args.resume)
+    resuming = args.resume and "build_id" in ckpt.state
+    if resuming:
+        if ckpt.state.get("mode") != mode:
+            logging.warning("checkpoint was a %s run – resuming as %s", ckpt.state.get("mode"), mode)
+        bid = BuildId(ckpt.state["build_id"])            # BuildId refreshes it if stale
+        logging.info(
+            "resuming: %d URLs harvested%s, %d cars already committed",
+            len(ckpt.links), " (complete)" if ckpt.state.get("harvested") else "", len(ckpt.done),
+        )
+    else:
+        bid = BuildId(get_build_id(session()))
+        ckpt.save(build_id=bid.value, mode=mode, harvested=False)
 
     conn = psycopg2.connect(DB_DSN)
     cur = conn.cursor()
-
-    # Wipe tables so we can inspect a clean run
-    cur.execute("TRUNCATE car_images, car_listings RESTART IDENTITY CASCADE;")
+    ensure_schema(cur)
     conn.commit()
-    logging.info("tables truncated – starting fresh")
+    known = None
 
-    tlocal = threading.local()
-    total = 0
-    for off in range(0, len(links), PARSE_CHUNK):
-        batch = list(links)[off : off + PARSE_CHUNK]
-        logging.info("[batch %d] %d URLs", off // PARSE_CHUNK + 1, len(batch))
+    if SPOOL_DIR and (left := Spool.segments(SPOOL_DIR)):
+        # a fresh reload truncates anyway; otherwise upsert them before anything
+        # newer is committed and mark them done so this run does not refetch them
+        if mode == "reload" and not resuming:
+            for name in left:
+                os.remove(name)
+            logging.warning("discarded %d spool segments from an earlier run", len(left))
+        else:
+            n = replay_spool(conn, on_commit=ckpt.mark_done)
+            logging.info("replayed %d spooled records from an earlier run", n)
 
-        with ThreadPoolExecutor(WORKERS) as pool:
-            recs = [r for r in pool.map(lambda u: scrape_detail(tlocal, u, bid), batch) if r]
-
-        bulk_insert(cur, recs)
+    if mode == "reload" and not resuming:
+        # Wipe tables so we can inspect a clean run
+        cur.execute("TRUNCATE car_images, car_listings RESTART IDENTITY CASCADE;")
         conn.commit()
-        total += len(recs)
-        logging.info("batch committed – running total %d", total)
+        logging.info("tables truncated – starting fresh")
+    elif mode != "reload":
+        known = load_hashes(cur)
+        logging.info("incremental mode – diffing against %d existing rows", len(known))
+
+    def store(wcur, recs):
+        if mode == "reload":
+            bulk_insert(wcur, recs)
+            return
+        ins, upd, img_add, img_del = upsert_batch(wcur, recs, known)
+        logging.info(
+            "upsert: %d new  %d changed  %d unchanged  images +%d -%d",
+            ins, upd, len(recs) - ins - upd, img_add, img_del,
+        )
 
-        del recs
-        gc.collect()
+    spool = Spool(SPOOL_DIR) if SPOOL_DIR else None
+
+    # a recording needs full bodies, not 304s
+    cache = DetailCache(DETAIL_CACHE) if DETAIL_CACHE and not RECORDER else None
+    writer = DbWriter(conn, store, on_commit=ckpt.mark_done, spool=spool)
+    writer.start()
+    links = ckpt.links           # journalled; filled as the harvest streams in
+    harvested = resuming and ckpt.state.get("harvested")
+
+    def source():
+        yield from list(links)   # left over from the interrupted run
+        if not harvested:
+            yield from iter_links(links)
+            ckpt.save(harvested=True)
+
+    start_parsers(args.parse_procs)
+    try:
+        if args.engine == "async":
+            asyncio.run(run_async(bid, writer, links, cache, skip=ckpt.done, harvest=not harvested))
+            ckpt.save(harvested=True)
+        else:
+            scrape_all(ckpt.pending(source()), bid, writer, cache)
+            reqs, conns = pool_stats()
+            logging.info("controller: %s", CONTROL)
+            logging.info(
+                "connection pool: %d requests over %d connections (%.0f%% reused)",
+                reqs, conns, 100 * (reqs - conns) / max(reqs, 1),
+            )
+    finally:
+        stop_parsers()
+        try:
+            writer.close()           # raises if the DB writer failed – after the rest is closed
+        finally:
+            mismatches = close_mismatch_log()
+            if spool:
+                spool.close()
+            if cache:
+                logging.info("detail cache: %d listings reused via 304", cache.hits)
+                cache.close()
+    total = writer.total
+
+    if mode != "reload" and links:
+        gone = prune_listings(cur, {car_id(u) for u in links})
+        conn.commit()
+        logging.info("pruned %d listings no longer on the site", gone)
 
-    logging.info("DONE – inserted %d listings   mismatches logged → %s", total, MISMATCH_CSV)
+    ckpt.finish()
+    if RECORDER:
+        RECORDER.close()
+    logging.info("DONE – inserted %d listings   %d mismatches logged → %s", total, mismatches, MISMATCH_CSV)
     cur.close()
     conn.close()
 